@@ -2,15 +2,24 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 
-from typing import List
+from typing import List, Optional
 
-import docker
 import asyncio
+import contextlib
+import functools
+import importlib
+import types
 import logging
+import time
+import re
+import shlex
+import socket
 
 import sys
 import os
 
+from concurrent.futures import ThreadPoolExecutor
+
 # --- Setup Logging ---
 logging.basicConfig(
     level=logging.INFO,
@@ -30,6 +39,11 @@ SUPPORTED_DISTROS = {
     "arch": "archlinux:latest"
 }
 
+# Derived once; the mapping is frozen below so these can never go stale
+_DISTRO_KEYS_TUPLE = tuple(SUPPORTED_DISTROS)
+_DISTRO_KEYS_JOINED = ", ".join(SUPPORTED_DISTROS)
+SUPPORTED_DISTROS = types.MappingProxyType(SUPPORTED_DISTROS)
+
 CURRENT_DISTRO_IMAGE = SUPPORTED_DISTROS['arch']
 CONTAINER_BASE_NAME = "discord-linux-shell"
 
@@ -39,6 +53,34 @@ SAFE_ENV = {
     'TERM': 'xterm'
 }
 
+# Docker-side health check for sandbox containers (durations in nanoseconds),
+# so the daemon tracks shell health and /term only reads State.Health
+SANDBOX_HEALTHCHECK = {
+    "test": ["CMD-SHELL", "command -v sh"],
+    "interval": 30 * 1_000_000_000,
+    "timeout": 2 * 1_000_000_000,
+    "retries": 3,
+}
+
+ALIVE_TTL = 5.0  # Seconds an inspect-based liveness check stays trusted
+SHELL_TTL = 120.0  # Seconds a successful exec shell probe stays trusted
+MESSAGE_LIMIT = 2000  # Discord message length limit
+OUTPUT_CAP = 4096  # Bytes kept per output stream; Discord shows 2000 chars at most
+KEEP_TAIL = 16  # Bytes carried between chunks past the cap; longer than any marker
+COMMAND_TIMEOUT = 120.0  # Seconds a command may run before it is killed
+KILL_GRACE = 5.0  # Seconds to wait for a killed command to hand back its output
+MAX_CONCURRENT_EXECS = 4  # Commands allowed to run in the sandbox at the same time
+DOCKER_WORKERS = 8  # Threads available for blocking Docker SDK calls
+
+# Trailer printed by the persistent shell after every command: \x1e<exit code>\x1e
+SHELL_SENTINEL = re.compile(rb"\x1e(\d+)\x1e$")
+
+# Frame markers emitted by /batch scripts: \x1eP<pid>\x1e reports the script's
+# PID, \x1eS<n>\x1e starts command n, \x1eE<exit code>\x1e ends it
+BATCH_MARKER = re.compile(rb"\x1e([PSE])(\d+)\x1e")
+# What is left of such a marker when a chunk ends before its closing \x1e
+MARKER_HEAD = re.compile(rb"\x1e[A-Z]?\d*")
+
 # --- Setup discord bot ---
 intents = discord.Intents.default()
 intents.message_content = True
@@ -46,7 +88,70 @@ intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
 
 # --- Container Management ---
-docker_client = docker.from_env()
+# The docker SDK (and requests/urllib3 under it) is imported lazily in on_ready
+# so it does not weigh on cold start; both stay None until then.
+docker = None
+docker_client = None
+
+_last_alive_ts: float = 0.0
+_last_shell_ok_ts: float = 0.0
+
+_current_short: str = CURRENT_DISTRO_IMAGE.split(':')[0]
+_current_container_id: str = f"{CONTAINER_BASE_NAME}-{_current_short}"
+
+_shell_sock = None
+_shell_exec_id = None
+_shell_pid = None  # PID of the persistent shell inside the container
+_shell_lock = asyncio.Lock()
+_exec_sem = asyncio.Semaphore(MAX_CONCURRENT_EXECS)
+_docker_executor = ThreadPoolExecutor(max_workers=DOCKER_WORKERS)
+
+_pulled: set[str] = set()  # Distro images known to be present locally
+_prewarm_task = None
+
+_pool: dict = {}  # Image -> Container; sandboxes of inactive distros are kept paused
+persistent_container = None  # Sandbox of the active distro, set in on_ready
+
+async def _docker(fn, *args, **kwargs):
+    """Run a blocking Docker SDK call in the default executor and await it.
+
+    The docker SDK talks to the daemon synchronously over HTTP; running it on
+    the event loop would stall discord.py's gateway heartbeat.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(fn, *args, **kwargs)
+    )
+
+@contextlib.asynccontextmanager
+async def sandbox_exclusive():
+    """Hold _shell_lock and every _exec_sem slot while the sandbox is swapped.
+
+    /batch only takes an exec slot, so pausing or removing the container
+    under the shell lock alone would freeze a batch mid-run. Both are taken
+    in the same order as /term (lock first), so the two cannot deadlock.
+    """
+    async with _shell_lock:
+        held = 0
+        try:
+            for _ in range(MAX_CONCURRENT_EXECS):
+                await _exec_sem.acquire()
+                held += 1
+            yield
+        finally:
+            for _ in range(held):
+                _exec_sem.release()
+
+def set_current_image(image: str):
+    """Make image the active distro and refresh the names derived from it.
+
+    The short distro name (the part before the ':') and the container name
+    are cached here so /term does not recompute them on every call.
+    """
+    global CURRENT_DISTRO_IMAGE, _current_short, _current_container_id
+
+    CURRENT_DISTRO_IMAGE = image
+    _current_short = image.split(':')[0]
+    _current_container_id = f"{CONTAINER_BASE_NAME}-{_current_short}"
 
 def get_container_id() -> str:
     """Return the stable container name for the current distro image.
@@ -54,7 +159,7 @@ def get_container_id() -> str:
     The container name is derived from CONTAINER_BASE_NAME and the distro
     image name (the part before the ':'), for example "discord-linux-shell-arch".
     """
-    return f"{CONTAINER_BASE_NAME}-{CURRENT_DISTRO_IMAGE.split(':')[0]}"
+    return _current_container_id
 
 def get_sandbox():
     """Return a small dict describing the current sandbox configuration.
@@ -67,11 +172,53 @@ def get_sandbox():
         "distro": CURRENT_DISTRO_IMAGE
     }
 
+def refresh_pool():
+    """Seed _pool with the sandbox containers that already exist.
+
+    A single filtered containers.list call replaces one lookup per distro.
+    Containers are matched to distro images by their expected names.
+    """
+    images_by_name = {
+        f"{CONTAINER_BASE_NAME}-{image.split(':')[0]}": image
+        for image in SUPPORTED_DISTROS.values()
+    }
+    existing = {
+        container.name: container
+        for container in docker_client.containers.list(
+            all=True, filters={"name": CONTAINER_BASE_NAME}
+        )
+    }
+
+    _pool.clear()
+    for name, container in existing.items():
+        if name in images_by_name:
+            _pool[images_by_name[name]] = container
+
+    logging.info(f"Found {len(_pool)} existing sandbox container(s).")
+
+def pause_inactive():
+    """Pause pooled sandboxes of every distro but the active one.
+
+    A sandbox that was active before a restart is otherwise left running at
+    its full memory limit, since CURRENT_DISTRO_IMAGE starts out at arch.
+    """
+    for image, container in _pool.items():
+        if image == CURRENT_DISTRO_IMAGE or container.status != "running":
+            continue
+        try:
+            container.pause()
+            logging.info(f"Paused inactive container '{container.name}'")
+        except Exception as e:
+            logging.warning(f"Could not pause inactive container '{container.name}': {e}")
+
 def ensure_container_running():
     """Create or retrieve the persistent Linux container.
 
     Behavior:
-    - If a container with the expected name exists and is stopped, it will be started.
+    - Containers are looked up in _pool, which refresh_pool() seeds at startup,
+      and by name if the pool has none (e.g. after a failed removal).
+    - If the container exists and is paused, it will be unpaused; if it is
+      stopped, it will be started.
     - If the container does not exist, it will be created with constrained resources
       and hardened settings (read-only root, dropped capabilities).
     - Returns the docker Container object on success.
@@ -85,18 +232,27 @@ def ensure_container_running():
     container_id = get_container_id()
 
     try:
-        container = docker_client.containers.get(container_id)
+        container = _pool.get(CURRENT_DISTRO_IMAGE)
 
-        if container.status != "running":
+        if container is None:
+            container = docker_client.containers.get(container_id)
+
+        container.reload()
+
+        if container.status == "paused":
+            logging.info(f"Container '{container_id}' found paused, unpausing...")
+            container.unpause()
+        elif container.status != "running":
             logging.info(f"Container '{container_id}' found but stopped, starting...")
             container.start()
 
         logging.info(f"Ataching to existing container: '{container_id}'")
 
+        _pool[CURRENT_DISTRO_IMAGE] = container
         return container
     except docker.errors.NotFound:
         logging.info(f"Container '{container_id}' not found, creating...")
-        pass
+        _pool.pop(CURRENT_DISTRO_IMAGE, None)
     except Exception as e:
         logging.error(f"Error checking for container '{container_id}': {e}")
         raise e
@@ -109,6 +265,7 @@ def ensure_container_running():
             tty=True,
             stdin_open=True,
             command=["tail", "-f", "/dev/null"],  # Keeps container alive
+            healthcheck=SANDBOX_HEALTHCHECK,
             environment=SAFE_ENV,
             mem_limit="256m",
             cpu_quota=20000,  # 20% of one CPU
@@ -121,20 +278,460 @@ def ensure_container_running():
 
         logging.info(f"Successfully created container: {container.name}")
 
+        _pool[CURRENT_DISTRO_IMAGE] = container
         return container
     except Exception as e:
         logging.error(f"FATAL: Could not create container: {e}")
         raise e
 
+def append_capped(buffer: bytearray, data: bytes, keep=None, carry=None):
+    """Append data to buffer without letting it grow past OUTPUT_CAP bytes.
+
+    If keep is a compiled pattern (of \\x1e-delimited markers), its matches in
+    the overflow are still appended so that in-band markers survive
+    truncation. A marker may be split across chunks, so past the cap the
+    unmatched end of the overflow is returned; pass it back as carry with the
+    next chunk of the same stream. None is returned until the cap is reached.
+    """
+    if carry is None:
+        room = OUTPUT_CAP - len(buffer)
+        if len(data) <= room:
+            buffer += data
+            return None
+        buffer += data[:room]
+        data = data[room:]
+        if keep is None:
+            return b""
+
+        # The cap may have cut a marker in two: move its kept half back out
+        # (looking back far enough to skip the end of a complete marker)
+        tail = buffer[-2 * KEEP_TAIL:]
+        last = max((match.end() for match in keep.finditer(tail)), default=0)
+        start = tail.rfind(b"\x1e", max(last, len(tail) - KEEP_TAIL))
+        carry = b""
+        if start != -1 and MARKER_HEAD.fullmatch(tail, start):
+            carry = bytes(tail[start:])
+            del buffer[len(buffer) - len(carry):]
+    elif keep is None:
+        return carry
+
+    scan = carry + data
+    end = 0
+    for match in keep.finditer(scan):
+        buffer += match.group(0)
+        end = match.end()
+
+    return scan[max(end, len(scan) - KEEP_TAIL):]
+
+def open_shell(container):
+    """Start a long-lived /bin/sh inside the container and attach to its stdin.
+
+    The shell is created through the low-level exec API so that commands can
+    be written to it one after another without paying for a new `docker exec`
+    each time.
+
+    Returns:
+        tuple: (exec_id, socket) for the attached shell.
+    """
+    exec_id = docker_client.api.exec_create(
+        container.id, ["/bin/sh"], stdin=True, tty=False, stdout=True, stderr=True
+    )["Id"]
+    sock = docker_client.api.exec_start(exec_id, socket=True)
+    getattr(sock, "_sock", sock).settimeout(None)  # Commands may run for a while
+
+    logging.info(f"Attached persistent shell to '{container.name}'")
+
+    return exec_id, sock
+
+def close_shell():
+    """Close the persistent shell socket, if any. The next command reopens it.
+
+    The underlying socket is shut down before it is closed: closing the
+    SocketIO wrapper alone leaves the fd open, so a thread blocked reading
+    the shell's output would never wake up.
+    """
+    global _shell_sock, _shell_exec_id, _shell_pid
+
+    if _shell_sock is not None:
+        raw = getattr(_shell_sock, "_sock", _shell_sock)
+        try:
+            raw.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # Already disconnected
+        try:
+            _shell_sock.close()
+            raw.close()
+        except Exception as e:
+            logging.warning(f"Could not close persistent shell: {e}")
+
+    _shell_sock = None
+    _shell_exec_id = None
+    _shell_pid = None
+
+def shell_roundtrip(payload: bytes):
+    """Write payload to the persistent shell and read until the sentinel.
+
+    The payload must end by printing a number wrapped in \\x1e markers; the
+    multiplexed stdout/stderr frames are read until that sentinel shows up.
+    Output past OUTPUT_CAP bytes is drained but not kept. If the shell exits
+    (e.g. the user ran `exit`), the socket is closed and the exit code is
+    taken from the exec instance instead.
+
+    Returns:
+        tuple: (stdout: bytes, stderr: bytes, number: int)
+    """
+    sock, exec_id = _shell_sock, _shell_exec_id
+    getattr(sock, "_sock", sock).sendall(payload)
+
+    stdout = bytearray()
+    stderr = bytearray()
+    stdout_total = 0
+    tail = b""  # Last bytes of stdout, where the sentinel will show up
+
+    for stream, data in docker.utils.socket.frames_iter(sock, tty=False):
+        if stream == docker.utils.socket.STDERR:
+            append_capped(stderr, data)
+            continue
+
+        append_capped(stdout, data)
+        stdout_total += len(data)
+        tail = (tail + data[-32:])[-32:]
+
+        match = SHELL_SENTINEL.search(tail)
+        if match:
+            del stdout[stdout_total - (len(tail) - match.start()):]
+            return bytes(stdout), bytes(stderr), int(match.group(1))
+
+    # EOF: the shell exited, or close_shell() already shut the socket down
+    if _shell_sock is sock:
+        close_shell()
+    exit_code = docker_client.api.exec_inspect(exec_id)["ExitCode"]
+
+    return bytes(stdout), bytes(stderr), exit_code if exit_code is not None else -1
+
+def run_in_shell(user_command: str, container):
+    """Run a command in container's persistent shell and collect its output.
+
+    Opens the shell first if needed (a fresh one after the previous shell
+    exited) and records its PID so a runaway command can be killed.
+
+    Callers must hold _shell_lock.
+
+    Returns:
+        tuple: (stdout: bytes, stderr: bytes, exit_code: int)
+    """
+    global _shell_sock, _shell_exec_id, _shell_pid
+
+    if _shell_sock is None:
+        _shell_exec_id, _shell_sock = open_shell(container)
+        _, _, _shell_pid = shell_roundtrip(b"\\command printf '\\036%d\\036' $$\n")
+
+    # eval of a quoted word always parses, so quoting mistakes fail fast instead
+    # of swallowing the sentinel line; `command` keeps a syntax error from
+    # exiting dash, and </dev/null keeps the command off the shell's stdin.
+    # The backslash skips aliases and `command` skips functions, so users of
+    # the shared shell cannot redefine printf and suppress the sentinel.
+    payload = (
+        f"\\command eval {shlex.quote(user_command)} </dev/null\n"
+        "\\command printf '\\036%d\\036' $?\n"
+    )
+    return shell_roundtrip(payload.encode())
+
+def kill_children(container, pid: int, include_parent: bool = False):
+    """SIGKILL the direct children of pid inside the container.
+
+    Runs as a separate control exec, since the process to kill keeps its own
+    exec busy. Children are found by scanning /proc, which works without
+    pkill being installed. With include_parent, pid itself is killed too.
+    """
+    script = (
+        "for p in /proc/[0-9]*; do "
+        "read -r _ _ _ ppid _ 2>/dev/null < \"$p/stat\" || continue; "
+        f"[ \"$ppid\" = {pid} ] && kill -9 \"${{p#/proc/}}\"; "
+        "done"
+    )
+    if include_parent:
+        script += f"; kill -9 {pid}"
+
+    container.exec_run(["/bin/sh", "-c", script], tty=False)
+
+async def execute_in_shell(user_command: str):
+    """Run a command in the persistent shell, killing it after COMMAND_TIMEOUT.
+
+    On timeout the command's processes are killed from a control exec, so the
+    shell reports exit code 137 and stays usable. If it does not answer within
+    KILL_GRACE seconds, the shell itself is killed and replaced. Should even
+    that not end the read, the shell is closed and the output collected so
+    far is returned with exit code 137.
+
+    Callers must hold _shell_lock.
+
+    Returns:
+        tuple: (stdout: bytes, stderr: bytes, exit_code: int)
+    """
+    container = persistent_container  # Kill in the sandbox the command runs in
+    pending = asyncio.ensure_future(_docker(run_in_shell, user_command, container))
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(pending), COMMAND_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.warning(f"Command timed out after {COMMAND_TIMEOUT:.0f}s: '{user_command}'")
+
+    await _docker(kill_children, container, _shell_pid)
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(pending), KILL_GRACE)
+    except asyncio.TimeoutError:
+        logging.warning("Persistent shell did not recover, killing it.")
+
+    await _docker(kill_children, container, _shell_pid, include_parent=True)
+
+    try:
+        return await asyncio.wait_for(asyncio.shield(pending), KILL_GRACE)
+    except asyncio.TimeoutError:
+        logging.warning("Persistent shell still not answering, closing it.")
+
+    close_shell()  # Shuts the socket down, so the reader thread sees EOF
+
+    try:
+        stdout, stderr, _ = await asyncio.wait_for(pending, KILL_GRACE)
+    except Exception:
+        stdout = stderr = b""  # Nothing could be recovered
+
+    return stdout, stderr, 137
+
+def fit_message(response: str) -> str:
+    """Truncate a response to Discord's message limit.
+
+    Characters outside the BMP (e.g. emoji) count twice, as some clients
+    measure the limit in UTF-16 code units. If the cut lands inside a code
+    block, the fence is closed on its own line so the message still renders.
+    """
+    if len(response) <= MESSAGE_LIMIT and response.isascii():
+        return response
+
+    if len(response.encode("utf-16-le")) // 2 <= MESSAGE_LIMIT:
+        return response
+
+    budget = MESSAGE_LIMIT - 4  # Room for "\n```"
+    end = 0
+    for end, char in enumerate(response):
+        budget -= 2 if ord(char) > 0xFFFF else 1
+        if budget < 0:
+            break
+    cut = response[:end].rstrip()
+
+    if cut.count("```") % 2:
+        cut += "\n```"
+
+    return cut
+
+def build_batch_script(commands: List[str], merge_stderr: bool = False) -> str:
+    """Build one /bin/sh script that runs every command in order.
+
+    The script first reports its PID (so it can be killed on timeout). Each
+    command is preceded by a start marker and followed by an end marker
+    carrying its exit status, so the output of a single exec can be split
+    back into per-command results. Start markers go to both stdout and
+    stderr, unless merge_stderr redirects stderr into stdout for the whole
+    script.
+    """
+    lines = ["exec 2>&1"] if merge_stderr else []
+    lines.append("printf '\\036P%d\\036' $$")
+    for index, cmd in enumerate(commands):
+        if merge_stderr:
+            lines.append(f"printf '\\036S%d\\036' {index}")
+        else:
+            lines.append(f"printf '\\036S%d\\036' {index}; printf '\\036S%d\\036' {index} >&2")
+        lines.append(cmd)
+        lines.append("printf '\\036E%d\\036' $?")
+
+    return "\n".join(lines) + "\n"
+
+def note_batch_pid(handle: dict, stdout: bytearray):
+    """Store the PID a /batch script reports at the start of its stdout."""
+    match = BATCH_MARKER.match(stdout)
+    if match and match.group(1) == b"P":
+        handle["pid"] = int(match.group(2))
+
+def run_batch(script: str, container, handle: dict, demux: bool = True):
+    """Run a /batch script in container and stream back its output.
+
+    The exec output is consumed as it arrives and each stream is capped at
+    OUTPUT_CAP bytes (batch markers are kept past the cap), so memory use
+    does not depend on how much the commands print. The script's PID is
+    stored in handle["pid"] as soon as it is reported; the stream and the
+    output collected so far are kept in handle["stream"], handle["stdout"]
+    and handle["stderr"] so a stuck run can be cut off.
+
+    Scripts built with merge_stderr only write to stdout; pass demux=False
+    for them so the SDK hands back plain chunks instead of splitting every
+    frame into an (stdout, stderr) pair.
+
+    Returns:
+        tuple: (stdout: bytes, stderr: bytes)
+    """
+    exec_id = docker_client.api.exec_create(
+        container.id, ["/bin/sh", "-c", script],
+        stdout=True, stderr=True, tty=False,
+    )["Id"]
+    stream = handle["stream"] = docker_client.api.exec_start(exec_id, stream=True, demux=demux)
+
+    stdout = handle["stdout"] = bytearray()
+    stderr = handle["stderr"] = bytearray()
+    out_carry = err_carry = None  # Possible partial markers, once past the cap
+
+    if demux:
+        for out, err in stream:
+            if out:
+                out_carry = append_capped(stdout, out, BATCH_MARKER, out_carry)
+            if err:
+                err_carry = append_capped(stderr, err, BATCH_MARKER, err_carry)
+            if "pid" not in handle:
+                note_batch_pid(handle, stdout)
+    else:
+        for chunk in stream:
+            out_carry = append_capped(stdout, chunk, BATCH_MARKER, out_carry)
+            if "pid" not in handle:
+                note_batch_pid(handle, stdout)
+
+    return bytes(stdout), bytes(stderr)
+
+async def execute_batch(script: str, demux: bool = True):
+    """Run a /batch script, killing it after COMMAND_TIMEOUT.
+
+    If the output stream is still open KILL_GRACE seconds after the kill
+    (e.g. a backgrounded child holds it), the stream is closed and whatever
+    was collected up to then is returned.
+
+    Returns:
+        tuple: (stdout: bytes, stderr: bytes, timed_out: bool)
+    """
+    container = persistent_container  # Kill in the sandbox the script runs in
+    handle = {}
+    pending = asyncio.ensure_future(_docker(run_batch, script, container, handle, demux))
+
+    try:
+        stdout, stderr = await asyncio.wait_for(asyncio.shield(pending), COMMAND_TIMEOUT)
+        return stdout, stderr, False
+    except asyncio.TimeoutError:
+        logging.warning(f"Batch timed out after {COMMAND_TIMEOUT:.0f}s")
+
+    if "pid" in handle:
+        try:
+            await _docker(kill_children, container, handle["pid"], include_parent=True)
+        except Exception as e:
+            logging.warning(f"Could not kill timed-out batch: {e}")
+
+    try:
+        stdout, stderr = await asyncio.wait_for(asyncio.shield(pending), KILL_GRACE)
+        return stdout, stderr, True
+    except asyncio.TimeoutError:
+        logging.warning("Batch output stayed open after the kill, closing it.")
+
+    if "stream" in handle:
+        try:
+            handle["stream"].close()  # Shuts the socket down, ending the reader thread
+        except Exception as e:
+            logging.warning(f"Could not close batch stream: {e}")
+
+    try:
+        await asyncio.wait_for(pending, KILL_GRACE)
+    except Exception:
+        pass  # The partial output below is all there is
+
+    return bytes(handle.get("stdout", b"")), bytes(handle.get("stderr", b"")), True
+
+def parse_batch_output(stdout: bytes, stderr: bytes, count: int):
+    """Split the output of a /batch script into per-command results.
+
+    Returns:
+        list: one (stdout: bytes, stderr: bytes, exit_code: int | None) tuple
+        per command. exit_code is None for commands that never finished,
+        e.g. because an earlier line made the script exit.
+    """
+    results = [[b"", b"", None] for _ in range(count)]
+
+    for slot, data in ((0, stdout), (1, stderr)):
+        parts = BATCH_MARKER.split(data or b"")
+        current = None
+
+        # parts = [preamble, kind, number, chunk, kind, number, chunk, ...]
+        for i in range(1, len(parts), 3):
+            kind, number, chunk = parts[i], int(parts[i + 1]), parts[i + 2]
+
+            if kind == b"P":
+                continue
+            elif kind == b"S":
+                current = number if number < count else None
+                if current is not None:
+                    results[current][slot] += chunk
+            elif current is not None and slot == 0:
+                results[current][2] = number
+                current = None
+
+    return [tuple(result) for result in results]
+
+async def wait_ready(container, deadline: float = 5.0) -> bool:
+    """Poll the container until its shell answers, with exponential backoff.
+
+    Replaces fixed sleeps after (re)creating a container: Docker usually
+    settles in well under a second, so the first few probes normally succeed.
+
+    Returns:
+        bool: True once `/bin/sh -c true` succeeds, False if deadline (seconds)
+        passes first.
+    """
+    global _last_alive_ts, _last_shell_ok_ts
+
+    delay = 0.05
+    started = time.monotonic()
+
+    while time.monotonic() - started < deadline:
+        try:
+            result = await _docker(container.exec_run, ["/bin/sh", "-c", "true"], tty=False)
+            if result.exit_code == 0:
+                _last_alive_ts = _last_shell_ok_ts = time.monotonic()
+                return True
+        except Exception as e:
+            logging.debug(f"Container '{container.name}' not ready yet: {e}")
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+    return False
+
+async def prewarm_images():
+    """Pull every supported distro image in the background.
+
+    Images are pulled one at a time so the daemon is not saturated while the
+    bot is serving commands. Each successfully pulled image is recorded in
+    _pulled, so /distro knows it can switch without a long download.
+    """
+    for image in SUPPORTED_DISTROS.values():
+        if image in _pulled:
+            continue
+
+        try:
+            await _docker(docker_client.images.pull, image)
+            _pulled.add(image)
+            logging.info(f"Pre-pulled image '{image}'")
+        except Exception as e:
+            logging.warning(f"Could not pre-pull image '{image}': {e}")
+
 # --- Bot events ---
 @bot.event
 async def on_ready():
     """Discord on_ready event handler.
 
-    Syncs application (slash) commands and ensures the sandbox container exists
-    and is running. Logs progress and failures.
+    Syncs application (slash) commands, connects to Docker (importing the SDK
+    on first use) and ensures the sandbox container exists and is running,
+    with the sandboxes of other distros paused, then starts pulling the other distro images in the background. Logs
+    progress and failures.
     """
-    global persistent_container
+    global persistent_container, _prewarm_task, docker, docker_client
+
+    asyncio.get_running_loop().set_default_executor(_docker_executor)
 
     try:
         await bot.tree.sync()
@@ -144,22 +741,146 @@ async def on_ready():
 
     logging.info(f"✅ Logged in as {bot.user}")
 
+    if docker_client is None:
+        try:
+            docker = await _docker(importlib.import_module, "docker")
+            docker_client = await _docker(docker.from_env)
+        except Exception as e:
+            logging.critical(f"[ON READY] ❌ Failed to connect to Docker: {e}")
+            return
+
     try:
-        persistent_container = ensure_container_running()
+        await _docker(refresh_pool)
+        await _docker(pause_inactive)
+        persistent_container = await _docker(ensure_container_running)
+        _pulled.add(CURRENT_DISTRO_IMAGE)
         logging.info(f"🌐 Container active: {persistent_container.name}")
     except Exception as e:
         logging.critical(f"[ON READY] ❌ Failed to start or find container: {e}")
 
+    if _prewarm_task is None or _prewarm_task.done():
+        _prewarm_task = asyncio.create_task(prewarm_images())
+
 # --- Commands ---
+async def rebuild_container(interaction: discord.Interaction):
+    """Remove the unhealthy sandbox container and create a fresh one.
+
+    Runs under sandbox_exclusive, so no /term or /batch command runs against
+    the container while it is being replaced. Progress and failures are reported
+    to the user through the interaction's followup channel.
+    """
+    global persistent_container, _last_alive_ts, _last_shell_ok_ts
+
+    await interaction.followup.send(
+        "🧹 The container environment was unhealthy. Rebuilding..."
+    )
+
+    async with sandbox_exclusive():
+        _last_alive_ts = _last_shell_ok_ts = 0.0
+        close_shell()
+        container_name = get_container_id()
+        _pool.pop(CURRENT_DISTRO_IMAGE, None)
+
+        try:
+            await _docker(docker_client.api.remove_container, container_name, force=True)
+            logging.info("Removed unhealthy container.")
+        except docker.errors.NotFound:
+            pass  # Ignore if it doesn't exist
+        except Exception as remove_e:
+            logging.error(f"Failed to remove unhealthy container: {remove_e}")
+
+        try:
+            persistent_container = await _docker(ensure_container_running)
+            if not await wait_ready(persistent_container):
+                logging.warning("Rebuilt container is not responding yet.")
+            await interaction.followup.send(
+                "✅ Container restored. Try your command again."
+            )
+            logging.info("Container restored.")
+        except Exception as rebuild_e:
+            logging.error(f"Failed to rebuild container: {rebuild_e}")
+            await interaction.followup.send(f"❌ Container rebuild FAILED: {rebuild_e}")
+
+async def sandbox_ready(interaction: discord.Interaction) -> bool:
+    """Tell the user to retry if the docker SDK is not loaded yet.
+
+    docker and docker_client stay None until on_ready has connected to the
+    daemon, and for good if Docker is unreachable.
+
+    Returns:
+        bool: True if sandbox commands can run.
+    """
+    if docker_client is not None:
+        return True
+
+    await interaction.followup.send(
+        "⏳ The sandbox is not ready yet (Docker is unavailable). Try again in a moment."
+    )
+    return False
+
+async def ensure_healthy(interaction: discord.Interaction) -> bool:
+    """Auto-recovery check run before executing user commands.
+
+    The check is tiered by cost:
+    - Liveness: inspect the container and read State.Running/Paused and the
+      daemon-tracked health status (see SANDBOX_HEALTHCHECK). Skipped while
+      the last successful one is younger than ALIVE_TTL.
+    - Shell: only for containers without a health check, exec a shell probe.
+      Skipped while the last successful one is younger than SHELL_TTL; a
+      working shell keeps working until the container is replaced.
+
+    An unhealthy container is rebuilt. Before Docker is available nothing is
+    checked; the user is told to retry instead (see sandbox_ready).
+
+    Returns:
+        bool: True if the caller may go on to execute its command.
+    """
+    global _last_alive_ts, _last_shell_ok_ts
+
+    if not await sandbox_ready(interaction):
+        return False
+
+    if time.monotonic() - _last_alive_ts < ALIVE_TTL:
+        return True
+
+    try:
+        state = (await _docker(docker_client.api.inspect_container, persistent_container.id))["State"]
+        if not state["Running"] or state.get("Paused"):
+            raise Exception(f"Container is {state.get('Status', 'not running')}")
+
+        health = state.get("Health")
+        if health:
+            # "starting" is fine: the first daemon-side check has not run yet
+            if health["Status"] == "unhealthy":
+                raise Exception("Shell test failed (container unhealthy)")
+        elif time.monotonic() - _last_shell_ok_ts >= SHELL_TTL:
+            # Containers created without SANDBOX_HEALTHCHECK: probe the shell ourselves
+            test = await _docker(
+                persistent_container.exec_run, cmd=["/bin/sh", "-c", "command -v sh"], tty=False
+            )
+            if test.exit_code != 0:
+                raise Exception("Shell test failed (container unhealthy)")
+            _last_shell_ok_ts = time.monotonic()
+
+        _last_alive_ts = time.monotonic()
+        return True
+    except Exception as e:
+        logging.warning(f"Container unhealthy ({e}). Rebuilding...")
+        await rebuild_container(interaction)
+        return False
+
 @bot.tree.command(name="term", description="Execute a command in the sandbox")
 @app_commands.describe(command="The shell command to execute")
 async def term(interaction: discord.Interaction, command: str):
     """Execute a shell command in the persistent sandbox container.
 
-    The command is run with /bin/sh -c inside the container. The function
+    The command is written to a persistent /bin/sh inside the container, so
+    working directory and shell variables carry over between calls. The function
     performs an auto-recovery health check and attempts to rebuild the sandbox
-    if the container appears unhealthy. Results (stdout/stderr) are returned
-    to the user as Discord messages and truncated to fit message length limits.
+    if the container appears unhealthy. Successful checks are cached (see
+    ensure_healthy), so back-to-back commands skip them. Results
+    (stdout/stderr) are returned to the user as Discord messages and truncated
+    to fit message length limits.
 
     Parameters:
         interaction (discord.Interaction): The invoking interaction.
@@ -170,77 +891,52 @@ async def term(interaction: discord.Interaction, command: str):
       message is shown.
     - Large outputs are truncated to fit Discord's message limit.
     """
-    global persistent_container, CURRENT_DISTRO_IMAGE
-
     await interaction.response.defer()
 
     user_command = command.strip()
     container_name = get_container_id()
 
-    # Auto-recovery check
-    try:
-        persistent_container.reload()
-        test = persistent_container.exec_run(
-            cmd=["/bin/sh", "-c", "command -v sh"], tty=False
-        )
-        if test.exit_code != 0:
-            raise Exception("Shell test failed (container unhealthy)")
-    except Exception as e:
-        logging.warning(f"Container unhealthy ({e}). Rebuilding...")
-        await interaction.followup.send(
-            "🧹 The container environment was unhealthy. Rebuilding..."
-        )
-
-        try:
-            old_container = docker_client.containers.get(container_name)
-            old_container.remove(force=True)
-            logging.info("Removed unhealthy container.")
-        except docker.errors.NotFound:
-            pass  # Ignore if it doesn't exist
-        except Exception as remove_e:
-            logging.error(f"Failed to remove unhealthy container: {remove_e}")
-
-        try:
-            persistent_container = ensure_container_running()
-            await asyncio.sleep(3)
-            await interaction.followup.send(
-                "✅ Container restored. Try your command again."
-            )
-            logging.info("Container restored.")
-        except Exception as rebuild_e:
-            logging.error(f"Failed to rebuild container: {rebuild_e}")
-            await interaction.followup.send(f"❌ Container rebuild FAILED: {rebuild_e}")
+    if not await ensure_healthy(interaction):
         return
 
     # Execute the user command
     try:
         logging.info(f"[{container_name}] Executing command: '{user_command}'")
 
-        exec_result = persistent_container.exec_run(
-            cmd=["/bin/sh", "-c", user_command], tty=True, demux=True
-        )
-        stdout, stderr = exec_result.output
+        # Wait for the shell before taking an exec slot, so /term calls queued
+        # behind a long command do not hold slots /batch could use
+        async with _shell_lock, _exec_sem:
+            stdout, stderr, exit_code = await execute_in_shell(user_command)
+    except Exception as e:
+        logging.error(f"Execution failure for command '{user_command}': {e}")
+        await interaction.followup.send(f"❌ Execution failure: {e}")
+        await rebuild_container(interaction)
+        return
+
+    try:
         stdout = stdout.decode("utf-8", errors="replace").strip() if stdout else ""
         stderr = stderr.decode("utf-8", errors="replace").strip() if stderr else ""
 
-        prompt = f"[{CURRENT_DISTRO_IMAGE.split(':')[0]}] $ {user_command}"
-        response = ""
+        prompt = f"[{_current_short}] $ {user_command}"
+        parts: List[str] = []
 
         # Check for timeout exit code
-        if exec_result.exit_code == 137:  # 128 + 9 (KILL signal)
-            response += "```diff\n- ⏰ Command TIMEOUT (KILLED after 120s).\n```"
-        elif exec_result.exit_code != 0 and not stderr:
-            stderr = f"Command failed with exit code {exec_result.exit_code}."
+        if exit_code == 137:  # 128 + 9 (KILL signal)
+            parts.append(f"```diff\n- ⏰ Command TIMEOUT (KILLED after {COMMAND_TIMEOUT:.0f}s).\n```")
+        elif exit_code != 0 and not stderr:
+            stderr = f"Command failed with exit code {exit_code}."
 
         if stdout:
-            response += f"```bash\n{prompt}\n{stdout}\n```"
+            parts.append(f"```bash\n{prompt}\n{stdout}\n```")
         if stderr:
-            response += f"```diff\n- ERROR:\n{stderr}\n```"
-        if not response:
-            response = f"```bash\n{prompt}\n✨ Command executed (exit {exec_result.exit_code}) but produced no output.\n```"
+            parts.append(f"```diff\n- ERROR:\n{stderr}\n```")
 
-        if len(response) > 2000:
-            response = response[:1997] + "```"
+        if parts:
+            response = "".join(parts)
+        else:
+            response = f"```bash\n{prompt}\n✨ Command executed (exit {exit_code}) but produced no output.\n```"
+
+        response = fit_message(response)
 
         await interaction.followup.send(response)
 
@@ -249,6 +945,110 @@ async def term(interaction: discord.Interaction, command: str):
         await interaction.followup.send(f"❌ Execution failure: {e}")
 
 
+class BatchModal(discord.ui.Modal, title="Run a batch"):
+    """Multi-line input for /batch.
+
+    Discord's client sends slash command options as a single line, so pasted
+    commands would run as one; a paragraph field keeps the line breaks.
+    """
+
+    commands = discord.ui.TextInput(
+        label="Shell commands, one per line",
+        style=discord.TextStyle.paragraph,
+        max_length=4000,
+    )
+
+    async def on_submit(self, interaction: discord.Interaction):
+        await run_batch_commands(interaction, self.commands.value)
+
+@bot.tree.command(name="batch", description="Execute several commands in the sandbox at once")
+@app_commands.describe(commands="Shell commands, one per line; leave empty to open a multi-line editor")
+async def batch(interaction: discord.Interaction, commands: Optional[str] = None):
+    """Execute several shell commands with a single exec call.
+
+    Without the commands option, a modal with a multi-line field is shown
+    and its contents are run once submitted (see BatchModal).
+
+    Parameters:
+        interaction (discord.Interaction): The invoking interaction.
+        commands (str, optional): Shell commands, one per line.
+    """
+    if commands is None:
+        await interaction.response.send_modal(BatchModal())
+        return
+
+    await run_batch_commands(interaction, commands)
+
+async def run_batch_commands(interaction: discord.Interaction, commands: str):
+    """Run newline-separated shell commands for /batch and post the results.
+
+    All commands are shipped to the container as one /bin/sh script, so N
+    commands cost one Docker round-trip instead of N. Per-command output and
+    exit codes are recovered from markers the script prints between commands.
+    Unless a command redirects to stderr (`>&2`), stderr is merged into
+    stdout and shown inline, as in a terminal.
+
+    Parameters:
+        interaction (discord.Interaction): The slash command or modal
+            submission to answer.
+        commands (str): Shell commands, one per line. Blank lines are skipped.
+    """
+    await interaction.response.defer(thinking=True)
+
+    user_commands = [line.strip() for line in commands.splitlines() if line.strip()]
+    container_name = get_container_id()
+
+    if not user_commands:
+        await interaction.followup.send("❌ No commands given.")
+        return
+
+    if not await ensure_healthy(interaction):
+        return
+
+    try:
+        logging.info(f"[{container_name}] Executing batch of {len(user_commands)} commands")
+
+        # Keep stdout and stderr apart only if a command explicitly writes to
+        # stderr; otherwise one combined stream is cheaper to read and parse
+        merge_stderr = not any(">&2" in cmd for cmd in user_commands)
+        script = build_batch_script(user_commands, merge_stderr=merge_stderr)
+
+        async with _exec_sem:
+            stdout, stderr, timed_out = await execute_batch(script, demux=not merge_stderr)
+        results = parse_batch_output(stdout, stderr, len(user_commands))
+
+        parts: List[str] = []
+
+        if timed_out:
+            parts.append(f"```diff\n- ⏰ Batch TIMEOUT (KILLED after {COMMAND_TIMEOUT:.0f}s).\n```")
+
+        for user_command, (out, err, exit_code) in zip(user_commands, results):
+            out = out.decode("utf-8", errors="replace").strip()
+            err = err.decode("utf-8", errors="replace").strip()
+
+            parts.append(f"```bash\n[{_current_short}] $ {user_command}\n")
+            if out:
+                parts.append(f"{out}\n")
+            parts.append("```")
+
+            if exit_code is None:
+                parts.append("```diff\n- Not executed (batch aborted).\n```")
+            elif err:
+                parts.append(f"```diff\n- ERROR (exit {exit_code}):\n{err}\n```")
+            elif exit_code != 0:
+                parts.append(f"```diff\n- Command failed with exit code {exit_code}.\n```")
+
+        response = "".join(parts)
+
+        response = fit_message(response)
+
+        await interaction.followup.send(response)
+
+    except Exception as e:
+        logging.error(f"Execution failure for batch: {e}")
+        await interaction.followup.send(f"❌ Execution failure: {e}")
+
+
 @bot.tree.command(name="distros", description="List all supported Linux distros")
 async def list_distros(interaction: discord.Interaction):
     """List available sandbox distributions.
@@ -270,7 +1070,7 @@ async def list_distros(interaction: discord.Interaction):
 @bot.tree.command(name="distro", description="Switch the sandbox distro")
 @app_commands.describe(name="The name of the distro to switch to (e.g., 'alpine')")
 async def switch_distro(interaction: discord.Interaction, name: str):
-    """Stop the current sandbox container and start a new one with the chosen distro.
+    """Pause the current sandbox container and activate one with the chosen distro.
 
     Parameters:
         interaction (discord.Interaction): The invoking interaction.
@@ -278,10 +1078,10 @@ async def switch_distro(interaction: discord.Interaction, name: str):
 
     Behavior:
         - Validates that the requested distro is supported.
-        - Updates CURRENT_DISTRO_IMAGE and recreates the persistent container.
-        - Attempts to stop and remove the previous container.
+        - Updates CURRENT_DISTRO_IMAGE and pauses the previous container.
+        - Unpauses the pooled container for the new distro, or creates it.
     """
-    global persistent_container, CURRENT_DISTRO_IMAGE
+    global persistent_container, _last_alive_ts, _last_shell_ok_ts
 
     await interaction.response.defer()
 
@@ -289,59 +1089,79 @@ async def switch_distro(interaction: discord.Interaction, name: str):
 
     if requested not in SUPPORTED_DISTROS:
         await interaction.followup.send(
-            f"❌ `{requested}` is unsupported. Supported options: {', '.join(SUPPORTED_DISTROS.keys())}"
+            f"❌ `{requested}` is unsupported. Supported options: {_DISTRO_KEYS_JOINED}"
         )
         return
 
     new_image = SUPPORTED_DISTROS[requested]
 
+    if not await sandbox_ready(interaction):
+        return
+
     if new_image == CURRENT_DISTRO_IMAGE:
         await interaction.followup.send(f"✅ Sandbox is already running `{requested}`.")
         return
 
     logging.info(f"Switching distro to '{requested}' ({new_image})")
-    CURRENT_DISTRO_IMAGE = new_image
-    await interaction.followup.send(
-        f"🌐 Switching sandbox to `{requested}` ({CURRENT_DISTRO_IMAGE})..."
-    )
+    # Wait for running /term and /batch commands, so none is mid-flight on the
+    # old sandbox while its shell is closed and the container paused
+    async with sandbox_exclusive():
+        set_current_image(new_image)
+        _last_alive_ts = _last_shell_ok_ts = 0.0
+        close_shell()
+        await interaction.followup.send(
+            f"🌐 Switching sandbox to `{requested}` ({CURRENT_DISTRO_IMAGE})..."
+        )
 
-    # Remove old container
-    if persistent_container:
+        # Park old container; switching back to it only needs an unpause
+        if persistent_container:
+            try:
+                await _docker(persistent_container.pause)
+                logging.info("Paused old container.")
+            except Exception as e:
+                logging.warning(f"Could not pause old container: {e}")
+                await interaction.followup.send(f"⚠️ Could not pause old container: {e}")
+
+        if new_image not in _pulled and new_image not in _pool:
+            await interaction.followup.send(
+                f"⏳ Pulling image `{new_image}`, this may take a while..."
+            )
+
+        # Activate (or create) the sandbox for the selected distro
         try:
-            persistent_container.stop(timeout=5)
-            await interaction.followup.send("ℹ️ Stopped old sandbox. Deleting...")
-            persistent_container.remove(force=True)
-            logging.info("Stopped and removed old container.")
+            persistent_container = await _docker(ensure_container_running)
+            _pulled.add(new_image)
+            if not await wait_ready(persistent_container):
+                logging.warning("New sandbox is not responding yet.")
+            await interaction.followup.send(f"✅ Sandbox switched to `{requested}`.")
+            logging.info("Successfully switched sandbox.")
         except Exception as e:
-            logging.warning(f"Could not remove old container: {e}")
-            await interaction.followup.send(f"⚠️ Could not remove old container: {e}")
-
-    # Recreate sandbox with selected distro
-    try:
-        persistent_container = ensure_container_running()
-        await asyncio.sleep(2)  # Give Docker time to settle
-        await interaction.followup.send(f"✅ Sandbox switched to `{requested}`.")
-        logging.info("Successfully switched sandbox.")
-    except Exception as e:
-        logging.error(f"Failed to switch distro: {e}")
-        await interaction.followup.send(f"❌ Failed to switch distro: {e}")
+            logging.error(f"Failed to switch distro: {e}")
+            await interaction.followup.send(f"❌ Failed to switch distro: {e}")
 
 
 # --- Autocompletion ---
+# (name, lowercase name, prebuilt Choice) for every distro, computed once
+_DISTRO_CHOICES_LOWER = tuple(
+    (name, name.lower(), app_commands.Choice(name=name, value=name))
+    for name in _DISTRO_KEYS_TUPLE
+)
+
 @switch_distro.autocomplete("name")
 async def distro_autocomplete(
     interaction: discord.Interaction, current: str
 ) -> List[app_commands.Choice[str]]:
     """Provide autocomplete choices for the /distro command.
 
-    Returns distro names that contain the current typed substring.
+    Returns distro names that contain the current typed substring, capped at
+    Discord's limit of 25 choices.
     """
-    choices = list(SUPPORTED_DISTROS.keys())
+    current_lower = current.lower()
     return [
-        app_commands.Choice(name=choice, value=choice)
-        for choice in choices
-        if current.lower() in choice.lower()
-    ]
+        choice
+        for _, name_lower, choice in _DISTRO_CHOICES_LOWER
+        if current_lower in name_lower
+    ][:25]
 
 
 def main():